@@ -0,0 +1,46 @@
+import hashlib
+
+
+def get_header(event, name):
+    """
+    Return a request header, whatever the case it was sent in, or None
+    """
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def make_etag(user_id, version):
+    """
+    Strong ETag for a stored user, derived from its version attribute.
+    The version is kept readable so that If-Match can be checked on write.
+    """
+    digest = hashlib.sha1((user_id + ':' + str(version)).encode()).hexdigest()
+    return '"' + str(version) + '-' + digest + '"'
+
+
+def parse_etag(user_id, etag):
+    """
+    Return the version an ETag was issued for, or None if the ETag was not
+    issued for this user
+    """
+    version, _, _ = etag.strip().strip('"').partition('-')
+    if not version.isdigit() or make_etag(user_id, int(version)) != etag.strip():
+        return None
+    return int(version)
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether an If-None-Match header matches the ETag
+    """
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
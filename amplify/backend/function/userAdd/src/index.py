@@ -3,13 +3,15 @@ import os
 import re
 import uuid
 
-import boto3
-from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 
-dynamodb = boto3.resource('dynamodb')
+from http_headers import make_etag
+from rate_limit import build_rate_limiter, client_key, retry_after
+from repository import VERSION_ATTRIBUTE, build_repository
+
 USERS_TABLE = os.environ.get('USERS_TABLE', 'users-dev')
-EMAIL_INDEX = 'email'
+repository = build_repository(os.environ.get('USERS_BACKEND', 'dynamodb'), USERS_TABLE)
+rate_limiter = build_rate_limiter('add', default_rate=2, default_burst=10)
 
 
 def add(event, context):
@@ -20,6 +22,12 @@ def add(event, context):
     }
 
     try:
+        # Throttle abusive clients before any validation or table access
+        if rate_limiter is not None:
+            wait = rate_limiter.check(client_key(event))
+            if wait:
+                return {'statusCode': 429, 'headers': dict(headers, **{'Retry-After': retry_after(wait)}), 'body': json.dumps({'error': 'Too many requests'})}
+
         if 'body' not in event or event['body'] is None:
             return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Request body is required'})}
 
@@ -43,14 +51,6 @@ def add(event, context):
         if name and len(name) > 100:
             return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Name must be less than 100 characters'})}
 
-        table = dynamodb.Table(USERS_TABLE)
-
-        # Check for existing user with the same email
-        existing = table.query(IndexName=EMAIL_INDEX, KeyConditionExpression=Key('email').eq(email))
-
-        if existing.get('Count', 0) > 0:
-            return {'statusCode': 409, 'headers': headers, 'body': json.dumps({'error': 'User with this email already exists'})}
-
         # Create new user
         user_id = str(uuid.uuid4())
         user = {'id': user_id, 'email': email}
@@ -59,9 +59,11 @@ def add(event, context):
         if name:
             user['name'] = name
 
-        table.put_item(Item=user)
+        # Reject the user if the email is already taken
+        if not repository.create_if_absent(dict(user, **{VERSION_ATTRIBUTE: 1})):
+            return {'statusCode': 409, 'headers': headers, 'body': json.dumps({'error': 'User with this email already exists'})}
 
-        return {'statusCode': 201, 'headers': headers, 'body': json.dumps(user)}
+        return {'statusCode': 201, 'headers': dict(headers, ETag=make_etag(user_id, 1)), 'body': json.dumps(user)}
 
     except ClientError as e:
         print("DynamoDB error:", e)
@@ -2,12 +2,15 @@ import json
 import os
 import re
 
-import boto3
 from botocore.exceptions import ClientError
 
-dynamodb = boto3.resource('dynamodb')
+from http_headers import etag_matches, get_header, make_etag
+from rate_limit import build_rate_limiter, client_key, retry_after
+from repository import VERSION_ATTRIBUTE, build_repository
+
 USERS_TABLE = os.environ.get('USERS_TABLE', 'users-dev')
-EMAIL_INDEX = 'email'
+repository = build_repository(os.environ.get('USERS_BACKEND', 'dynamodb'), USERS_TABLE)
+rate_limiter = build_rate_limiter('get', default_rate=10, default_burst=20)
 
 
 def get(event, context):
@@ -18,6 +21,12 @@ def get(event, context):
     }
 
     try:
+        # Throttle abusive clients before any validation or table access
+        if rate_limiter is not None:
+            wait = rate_limiter.check(client_key(event))
+            if wait:
+                return {'statusCode': 429, 'headers': dict(headers, **{'Retry-After': retry_after(wait)}), 'body': json.dumps({'error': 'Too many requests'})}
+
         query_params = event.get('queryStringParameters') or {}
         email = query_params.get('email', '').strip()
 
@@ -27,14 +36,18 @@ def get(event, context):
         if not is_valid_email(email):
             return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Invalid email format'})}
 
-        table = dynamodb.Table(USERS_TABLE)
-
-        response = table.query(IndexName=EMAIL_INDEX, KeyConditionExpression=boto3.dynamodb.conditions.Key('email').eq(email))
+        user = repository.get_by_email(email)
 
-        if response.get('Count', 0) == 0:
+        if user is None:
             return {'statusCode': 404, 'headers': headers, 'body': json.dumps({'error': 'User not found'})}
 
-        user = response['Items'][0]
+        # Users written before versioning count as version 0
+        etag = make_etag(user['id'], int(user.pop(VERSION_ATTRIBUTE, 0)))
+        headers['ETag'] = etag
+
+        if etag_matches(get_header(event, 'If-None-Match'), etag):
+            return {'statusCode': 304, 'headers': headers, 'body': ''}
+
         return {'statusCode': 200, 'headers': headers, 'body': json.dumps(user)}
 
     except ClientError as e:
@@ -0,0 +1,170 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+
+MAX_TRACKED_CLIENTS = 10000
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average, with bursts up to `burst`
+    """
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = now
+
+    def take(self, now):
+        """
+        Take a token and return 0, or return the seconds until one is available
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class InMemoryCounterStore:
+    """
+    Local stand-in for the shared DynamoDB counters
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def increment(self, key, limit, expires_at):
+        """
+        Count one request under key unless limit is already reached.
+        Return True when the request was counted.
+        """
+        with self._lock:
+            count = self.counters.get(key, 0)
+            if count >= limit:
+                return False
+            self.counters[key] = count + 1
+            return True
+
+
+class DynamoDBCounterStore:
+    """
+    Counters shared by every container, one item per client and window.
+    Items carry an `expires_at` attribute to be used as the table's TTL.
+    """
+
+    def __init__(self, table_name, resource=None):
+        self.table = (resource or boto3.resource('dynamodb')).Table(table_name)
+
+    def increment(self, key, limit, expires_at):
+        try:
+            self.table.update_item(Key={'id': key},
+                                   UpdateExpression='ADD #count :one SET expires_at = :expires_at',
+                                   ConditionExpression='attribute_not_exists(#count) OR #count < :limit',
+                                   ExpressionAttributeNames={'#count': 'count'},
+                                   ExpressionAttributeValues={
+                                       ':one': 1,
+                                       ':limit': limit,
+                                       ':expires_at': int(expires_at)
+                                   })
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+
+class RateLimiter:
+    """
+    Per-client limiter for one route. A token bucket in the warm container
+    absorbs most of the load; when a counter store is set, a fixed window
+    of `shared_limit` requests per client is also enforced across containers.
+    """
+
+    def __init__(self, route, rate, burst, store=None, shared_limit=None, window=60, clock=time.time):
+        self.route = route
+        self.rate = rate
+        self.burst = burst
+        self.store = store
+        self.shared_limit = shared_limit
+        self.window = window
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client):
+        """
+        Return 0 when the client may proceed, or the seconds it should wait
+        """
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+                if len(self._buckets) > MAX_TRACKED_CLIENTS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+            wait = bucket.take(now)
+        if wait or self.store is None:
+            return wait
+
+        window_start = now // self.window * self.window
+        window_end = window_start + self.window
+        key = '%s#%s#%d' % (self.route, client, window_start)
+        try:
+            if not self.store.increment(key, self.shared_limit, window_end):
+                return window_end - now
+        except (ClientError, BotoCoreError) as e:
+            # The shared counter is best effort: when it fails or cannot be
+            # reached, the local bucket still applies
+            print("Rate limit counter error:", e)
+        return 0
+
+
+def client_key(event):
+    """
+    Identify the caller by API key when present, otherwise by source IP
+    """
+    request_context = event.get('requestContext') or {}
+    identity = request_context.get('identity') or {}
+    if identity.get('apiKey'):
+        return 'key:' + identity['apiKey']
+    source_ip = identity.get('sourceIp') or (request_context.get('http') or {}).get('sourceIp')
+    return 'ip:' + (source_ip or 'unknown')
+
+
+def retry_after(wait):
+    return str(max(1, math.ceil(wait)))
+
+
+def build_rate_limiter(route, default_rate, default_burst):
+    """
+    Build the limiter for a route from its RATE_LIMIT_<ROUTE>_* settings.
+    A rate of 0 disables the limiter. Shared limits need RATE_LIMIT_TABLE.
+    """
+    prefix = 'RATE_LIMIT_' + route.upper() + '_'
+    rate = float(os.environ.get(prefix + 'RATE', default_rate))
+    if rate <= 0:
+        return None
+    burst = float(os.environ.get(prefix + 'BURST', default_burst))
+
+    store = None
+    shared_limit = os.environ.get(prefix + 'SHARED_LIMIT')
+    table_name = os.environ.get('RATE_LIMIT_TABLE')
+    if shared_limit and table_name:
+        store = DynamoDBCounterStore(table_name)
+    return RateLimiter(route,
+                       rate,
+                       burst,
+                       store=store,
+                       shared_limit=int(shared_limit) if store else None,
+                       window=int(os.environ.get('RATE_LIMIT_WINDOW', '60')))
@@ -0,0 +1,367 @@
+import os
+import threading
+import time
+import zlib
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+EMAIL_INDEX = 'email'
+VERSION_ATTRIBUTE = 'version'
+EMAIL_SENTINEL_PREFIX = 'email#'
+BATCH_GET_LIMIT = 100
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+class UserNotFoundError(Exception):
+    pass
+
+
+class VersionConflictError(Exception):
+    pass
+
+
+def serialize_value(value):
+    """
+    Marshal a value into DynamoDB's attribute format. Users only hold
+    strings and numbers, so those skip boto3's generic TypeSerializer.
+    """
+    if type(value) is str:
+        return {'S': value}
+    if type(value) is int or type(value) is Decimal:
+        return {'N': str(value)}
+    return _serializer.serialize(value)
+
+
+def deserialize_value(value):
+    if 'S' in value:
+        return value['S']
+    if 'N' in value:
+        number = value['N']
+        # Integers, like the version, skip the Decimal context entirely
+        if number.lstrip('-').isdigit():
+            return int(number)
+        return Decimal(number)
+    return _deserializer.deserialize(value)
+
+
+def serialize_item(item):
+    return {name: serialize_value(value) for name, value in item.items()}
+
+
+def deserialize_item(item):
+    return {name: deserialize_value(value) for name, value in item.items()}
+
+
+class UserRepository:
+    """
+    Storage interface for users, implemented by every backend
+    """
+
+    def get_by_email(self, email):
+        """
+        Return the first user found through the email index, or None
+        """
+        raise NotImplementedError
+
+    def get_by_id(self, user_id):
+        """
+        Return the user with the given id, or None
+        """
+        raise NotImplementedError
+
+    def create_if_absent(self, user):
+        """
+        Store the user unless its id exists or its email is already taken,
+        either by a user created through this method or by one found in the
+        email index. Return True when the user was created.
+        """
+        raise NotImplementedError
+
+    def update(self, user_id, changes, expected_version=None):
+        """
+        Apply changes to an existing user and bump its version. A change to
+        None removes the attribute. When expected_version is given, the
+        update only happens if the stored version still matches.
+        Return the updated user.
+        """
+        raise NotImplementedError
+
+    def batch_get(self, user_ids):
+        """
+        Return the existing users among user_ids, in request order
+        """
+        raise NotImplementedError
+
+    def scan(self, segment, total_segments, start_key=None, limit=None):
+        """
+        Read one page of one segment of a parallel scan. Return the users
+        and the key to resume from, which is None once the segment is done.
+        """
+        raise NotImplementedError
+
+    def batch_create_if_absent(self, users):
+        """
+        Create every user whose email is not taken, and return those created
+        """
+        created = []
+        seen = set()
+        for user in users:
+            if user['email'] in seen:
+                continue
+            seen.add(user['email'])
+            if self.create_if_absent(user):
+                created.append(user)
+        return created
+
+
+class DynamoDBUserRepository(UserRepository):
+    """
+    Users stored in a DynamoDB table with an `email` global secondary index.
+
+    Emails are kept unique by an `email#<email>` sentinel item, written in
+    the same transaction as the user. Users stored before the sentinels
+    existed are still caught by a query on the email index.
+
+    Goes through the low-level client with the marshaller below instead of
+    the resource layer, whose generic (de)serialization costs real CPU time
+    on small items.
+    """
+
+    def __init__(self, table_name, client=None):
+        self.table_name = table_name
+        self.client = client or boto3.client('dynamodb')
+        # Parts of the requests that never change are built once
+        self._query_by_email = {
+            'TableName': table_name,
+            'IndexName': EMAIL_INDEX,
+            'KeyConditionExpression': '#email = :email',
+            'ExpressionAttributeNames': {
+                '#email': 'email'
+            },
+            'Limit': 1,
+        }
+
+    def get_by_email(self, email):
+        response = self.client.query(ExpressionAttributeValues={':email': {'S': email}}, **self._query_by_email)
+        if not response['Items']:
+            return None
+        return deserialize_item(response['Items'][0])
+
+    def get_by_id(self, user_id):
+        # Sentinels share the id key but are not users
+        if user_id.startswith(EMAIL_SENTINEL_PREFIX):
+            return None
+        item = self.client.get_item(TableName=self.table_name, Key={'id': {'S': user_id}}).get('Item')
+        return deserialize_item(item) if item is not None else None
+
+    def create_if_absent(self, user):
+        if self.get_by_email(user['email']) is not None:
+            return False
+        sentinel = {'id': {'S': EMAIL_SENTINEL_PREFIX + user['email']}, 'user_id': {'S': user['id']}}
+        try:
+            self.client.transact_write_items(TransactItems=[
+                {'Put': {'TableName': self.table_name, 'Item': sentinel, 'ConditionExpression': 'attribute_not_exists(id)'}},
+                {'Put': {'TableName': self.table_name, 'Item': serialize_item(user), 'ConditionExpression': 'attribute_not_exists(id)'}},
+            ])
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            reasons = {reason.get('Code') for reason in e.response.get('CancellationReasons', [])}
+            # A conflict means an overlapping add is writing the same sentinel
+            if not reasons & {'ConditionalCheckFailed', 'TransactionConflict'}:
+                raise
+            return False
+        return True
+
+    def update(self, user_id, changes, expected_version=None):
+        names = {'#email': 'email', '#version': VERSION_ATTRIBUTE}
+        values = {':zero': {'N': '0'}, ':one': {'N': '1'}}
+        sets = ['#version = if_not_exists(#version, :zero) + :one']
+        removes = []
+        for index, (attribute, value) in enumerate(sorted(changes.items())):
+            names['#a%d' % index] = attribute
+            if value is None:
+                removes.append('#a%d' % index)
+            else:
+                values[':a%d' % index] = serialize_value(value)
+                sets.append('#a%d = :a%d' % (index, index))
+        expression = 'SET ' + ', '.join(sets)
+        if removes:
+            expression += ' REMOVE ' + ', '.join(removes)
+
+        # attribute_exists keeps UpdateItem from creating a new user, and
+        # from writing to a sentinel as those have no email
+        condition = 'attribute_exists(#email)'
+        if expected_version == 0:
+            condition += ' AND attribute_not_exists(#version)'
+        elif expected_version is not None:
+            condition += ' AND #version = :expected'
+            values[':expected'] = {'N': str(expected_version)}
+
+        try:
+            response = self.client.update_item(TableName=self.table_name,
+                                               Key={'id': {'S': user_id}},
+                                               UpdateExpression=expression,
+                                               ConditionExpression=condition,
+                                               ExpressionAttributeNames=names,
+                                               ExpressionAttributeValues=values,
+                                               ReturnValues='ALL_NEW')
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            # Only a failed write pays for the read telling both cases apart
+            if self.get_by_id(user_id) is None:
+                raise UserNotFoundError(user_id)
+            raise VersionConflictError(user_id)
+        return deserialize_item(response['Attributes'])
+
+    def batch_get(self, user_ids):
+        user_ids = [user_id for user_id in dict.fromkeys(user_ids) if not user_id.startswith(EMAIL_SENTINEL_PREFIX)]
+        found = {}
+        for start in range(0, len(user_ids), BATCH_GET_LIMIT):
+            keys = [{'id': {'S': user_id}} for user_id in user_ids[start:start + BATCH_GET_LIMIT]]
+            request = {self.table_name: {'Keys': keys}}
+            # DynamoDB may hand back part of the batch as UnprocessedKeys
+            while request:
+                response = self.client.batch_get_item(RequestItems=request)
+                for item in response.get('Responses', {}).get(self.table_name, []):
+                    found[item['id']['S']] = item
+                request = response.get('UnprocessedKeys')
+        return [deserialize_item(found[user_id]) for user_id in user_ids if user_id in found]
+
+    def scan(self, segment, total_segments, start_key=None, limit=None):
+        request = {
+            'TableName': self.table_name,
+            'Segment': segment,
+            'TotalSegments': total_segments,
+            # Email sentinels are not users
+            'FilterExpression': 'NOT begins_with(#id, :sentinel)',
+            'ExpressionAttributeNames': {
+                '#id': 'id'
+            },
+            'ExpressionAttributeValues': {
+                ':sentinel': {
+                    'S': EMAIL_SENTINEL_PREFIX
+                }
+            },
+        }
+        if start_key is not None:
+            request['ExclusiveStartKey'] = serialize_item(start_key)
+        if limit is not None:
+            request['Limit'] = limit
+        response = self.client.scan(**request)
+        last_key = response.get('LastEvaluatedKey')
+        return [deserialize_item(item) for item in response['Items']], deserialize_item(last_key) if last_key else None
+
+
+
+class InMemoryUserRepository(UserRepository):
+    """
+    Indexed in-memory backend with the same semantics as DynamoDB.
+
+    Writes reach the email index `index_lag` seconds after they are stored,
+    like the eventually consistent global secondary index they stand in for.
+    Emails taken through create_if_absent are tracked apart from the index,
+    like the DynamoDB sentinels, so uniqueness holds whatever the lag.
+    """
+
+    def __init__(self, index_lag=0.0, clock=time.monotonic):
+        self.index_lag = index_lag
+        self.clock = clock
+        self._items = {}
+        self._email_index = {}
+        self._taken_emails = set()
+        self._lock = threading.Lock()
+
+    def _indexed_ids(self, email):
+        now = self.clock()
+        return [user_id for visible_at, user_id in self._email_index.get(email, []) if visible_at <= now]
+
+    def _store(self, user):
+        previous = self._items.get(user['id'])
+        self._items[user['id']] = dict(user)
+        if previous is not None:
+            if previous['email'] == user['email']:
+                return
+            entries = self._email_index[previous['email']]
+            entries[:] = [entry for entry in entries if entry[1] != user['id']]
+        self._email_index.setdefault(user['email'], []).append((self.clock() + self.index_lag, user['id']))
+
+    def put(self, user):
+        """
+        Store the user unconditionally, like a plain PutItem
+        """
+        with self._lock:
+            self._store(user)
+
+    def get_by_email(self, email):
+        with self._lock:
+            ids = self._indexed_ids(email)
+            return dict(self._items[ids[0]]) if ids else None
+
+    def get_by_id(self, user_id):
+        with self._lock:
+            user = self._items.get(user_id)
+            return dict(user) if user is not None else None
+
+    def create_if_absent(self, user):
+        with self._lock:
+            # Like the attribute_not_exists(id) condition in DynamoDB
+            if user['id'] in self._items:
+                return False
+            if user['email'] in self._taken_emails or self._indexed_ids(user['email']):
+                return False
+            self._taken_emails.add(user['email'])
+            self._store(user)
+            return True
+
+    def update(self, user_id, changes, expected_version=None):
+        with self._lock:
+            user = self._items.get(user_id)
+            if user is None:
+                raise UserNotFoundError(user_id)
+            version = user.get(VERSION_ATTRIBUTE, 0)
+            if expected_version is not None and version != expected_version:
+                raise VersionConflictError(user_id)
+            updated = dict(user)
+            for attribute, value in changes.items():
+                if value is None:
+                    updated.pop(attribute, None)
+                else:
+                    updated[attribute] = value
+            updated[VERSION_ATTRIBUTE] = version + 1
+            self._store(updated)
+            return dict(updated)
+
+    def scan(self, segment, total_segments, start_key=None, limit=None):
+        with self._lock:
+            # Segments split the ids by hash, pages follow id order
+            user_ids = sorted(user_id for user_id in self._items if zlib.crc32(user_id.encode()) % total_segments == segment)
+            if start_key is not None:
+                user_ids = [user_id for user_id in user_ids if user_id > start_key['id']]
+            if limit is None or len(user_ids) <= limit:
+                return [dict(self._items[user_id]) for user_id in user_ids], None
+            page = user_ids[:limit]
+            return [dict(self._items[user_id]) for user_id in page], {'id': page[-1]}
+
+    def batch_get(self, user_ids):
+        with self._lock:
+            return [dict(self._items[user_id]) for user_id in dict.fromkeys(user_ids) if user_id in self._items]
+
+
+def build_repository(backend=None, table_name=None):
+    """
+    Build the users backend selected by the USERS_BACKEND setting
+    """
+    backend = backend or os.environ.get('USERS_BACKEND', 'dynamodb')
+    table_name = table_name or os.environ.get('USERS_TABLE', 'users-dev')
+    if backend == 'dynamodb':
+        return DynamoDBUserRepository(table_name)
+    if backend == 'memory':
+        return InMemoryUserRepository(index_lag=float(os.environ.get('USERS_INDEX_LAG', '0')))
+    raise ValueError('Unknown users backend: ' + backend)
@@ -0,0 +1,72 @@
+import json
+import os
+
+from botocore.exceptions import ClientError
+
+from http_headers import get_header, make_etag, parse_etag
+from repository import VERSION_ATTRIBUTE, UserNotFoundError, VersionConflictError, build_repository
+
+USERS_TABLE = os.environ.get('USERS_TABLE', 'users-dev')
+repository = build_repository(os.environ.get('USERS_BACKEND', 'dynamodb'), USERS_TABLE)
+
+
+def update(event, context):
+    headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Headers': '*',
+        'Access-Control-Allow-Methods': '*',
+    }
+
+    try:
+        if 'body' not in event or event['body'] is None:
+            return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Request body is required'})}
+
+        try:
+            data = json.loads(event['body'])
+        except (json.JSONDecodeError, TypeError):
+            return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Invalid JSON in request body'})}
+
+        user_id = data.get('id', '').strip()
+        if not user_id:
+            return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'User id is required'})}
+
+        # Only fields present in the body are changed, other fields are ignored
+        changes = {}
+        if 'name' in data:
+            name = (data['name'] or '').strip()
+
+            # Same rule as when the user is added
+            if name and len(name) > 100:
+                return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'Name must be less than 100 characters'})}
+
+            # An empty name removes it, as add never stores an empty name
+            changes['name'] = name or None
+
+        if not changes:
+            return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'No fields to update'})}
+
+        # Optimistic concurrency through the ETag returned by add and get
+        expected_version = None
+        if_match = get_header(event, 'If-Match')
+        if if_match and if_match.strip() != '*':
+            expected_version = parse_etag(user_id, if_match)
+            if expected_version is None:
+                return {'statusCode': 412, 'headers': headers, 'body': json.dumps({'error': 'User was modified by another request'})}
+
+        try:
+            user = repository.update(user_id, changes, expected_version)
+        except UserNotFoundError:
+            return {'statusCode': 404, 'headers': headers, 'body': json.dumps({'error': 'User not found'})}
+        except VersionConflictError:
+            return {'statusCode': 412, 'headers': headers, 'body': json.dumps({'error': 'User was modified by another request'})}
+
+        version = int(user.pop(VERSION_ATTRIBUTE))
+        headers['ETag'] = make_etag(user_id, version)
+        return {'statusCode': 200, 'headers': headers, 'body': json.dumps(user)}
+
+    except ClientError as e:
+        print("DynamoDB error:", e)
+        return {'statusCode': 500, 'headers': headers, 'body': json.dumps({'error': 'Database error: ' + str(e)})}
+    except Exception as e:
+        print("Unhandled exception:", e)
+        return {'statusCode': 500, 'headers': headers, 'body': json.dumps({'error': 'Internal server error'})}
@@ -0,0 +1,190 @@
+"""
+Export the users table to gzip-compressed NDJSON, one file per scan segment.
+
+Segments are scanned in parallel by a worker pool, a page at a time, so
+memory stays bounded whatever the table size. Every page is appended as
+its own gzip member and followed by a checkpoint recording the resume key
+and the file size. A run that crashes or times out is resumed by running
+the same command again: each segment's file is first truncated back to its
+last checkpoint, so a page written without its checkpoint is not exported
+twice. Once every segment is done, manifest.json lists the files with
+their item counts and SHA-256 checksums.
+
+Only unfinished runs are resumed. An output directory that already holds a
+manifest is refused, unless --restart is given to export from scratch.
+
+    python scripts/export_users.py --table users-dev --output exports/users-dev
+"""
+import argparse
+import base64
+import concurrent.futures
+import glob
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+# The export reads through the same repository as the functions
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'function', 'userGet', 'src'))
+
+from repository import DynamoDBUserRepository  # noqa: E402
+
+MANIFEST = 'manifest.json'
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode()
+    raise TypeError('Cannot export value of type ' + type(value).__name__)
+
+
+def segment_paths(output, segment):
+    name = 'segment-%04d' % segment
+    return os.path.join(output, name + '.ndjson.gz'), os.path.join(output, name + '.checkpoint.json')
+
+
+def write_json(path, data):
+    # Write then rename, so a crash never leaves a half-written file behind
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_checkpoint(path, total_segments):
+    if not os.path.exists(path):
+        return {'total_segments': total_segments, 'last_key': None, 'items': 0, 'bytes': 0, 'done': False}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint['total_segments'] != total_segments:
+        raise ValueError('Checkpoint %s was written for %d segments, not %d' % (path, checkpoint['total_segments'], total_segments))
+    return checkpoint
+
+
+def export_segment(repository, output, segment, total_segments, page_size):
+    """
+    Export one segment from its last checkpoint. Return the segment's
+    checkpoint and the number of items exported by this call.
+    """
+    data_path, checkpoint_path = segment_paths(output, segment)
+    checkpoint = load_checkpoint(checkpoint_path, total_segments)
+    if checkpoint['done']:
+        return checkpoint, 0
+
+    # Truncating a short file would pad it with zeros, not restore the pages
+    size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+    if size < checkpoint['bytes']:
+        raise ValueError('Checkpoint %s expects %d bytes in %s, found %d: the checkpoint and data file disagree' %
+                         (checkpoint_path, checkpoint['bytes'], data_path, size))
+
+    # Drop whatever was written after the last checkpoint
+    with open(data_path, 'ab') as f:
+        f.truncate(checkpoint['bytes'])
+
+    exported = 0
+    while not checkpoint['done']:
+        users, last_key = repository.scan(segment, total_segments, checkpoint['last_key'], page_size)
+        if users:
+            with open(data_path, 'ab') as f:
+                with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as member:
+                    for user in users:
+                        member.write(json.dumps(user, default=json_default, sort_keys=True).encode() + b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+                checkpoint['bytes'] = f.tell()
+        checkpoint['items'] += len(users)
+        checkpoint['last_key'] = last_key
+        checkpoint['done'] = last_key is None
+        write_json(checkpoint_path, checkpoint)
+        exported += len(users)
+    return checkpoint, exported
+
+
+def clear_export(output):
+    """
+    Remove the files of a previous export, finished or not
+    """
+    for path in glob.glob(os.path.join(output, 'segment-*')) + [os.path.join(output, MANIFEST)]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def export_users(repository, output, total_segments=4, workers=4, page_size=100, restart=False):
+    """
+    Export every segment, resuming an unfinished run from its checkpoints,
+    and write the manifest. A finished export in output is only replaced
+    when restart is set.
+    """
+    os.makedirs(output, exist_ok=True)
+    if restart:
+        clear_export(output)
+    elif os.path.exists(os.path.join(output, MANIFEST)):
+        raise FileExistsError('%s already holds a finished export' % output)
+    started = time.monotonic()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(export_segment, repository, output, segment, total_segments, page_size) for segment in range(total_segments)]
+        results = [future.result() for future in futures]
+
+    elapsed = time.monotonic() - started
+    exported = sum(count for _, count in results)
+    segments = []
+    for segment, (checkpoint, _) in enumerate(results):
+        data_path, _ = segment_paths(output, segment)
+        segments.append({
+            'segment': segment,
+            'file': os.path.basename(data_path),
+            'items': checkpoint['items'],
+            'bytes': checkpoint['bytes'],
+            'sha256': file_sha256(data_path),
+        })
+
+    manifest = {
+        'total_segments': total_segments,
+        'items': sum(segment['items'] for segment in segments),
+        'segments': segments,
+        'exported_this_run': exported,
+        'seconds': round(elapsed, 3),
+        'items_per_second': round(exported / elapsed, 1) if elapsed > 0 else None,
+    }
+    write_json(os.path.join(output, MANIFEST), manifest)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the users table to compressed NDJSON')
+    parser.add_argument('--output', required=True, help='directory for the segment files, checkpoints and manifest')
+    parser.add_argument('--table', default=os.environ.get('USERS_TABLE', 'users-dev'))
+    parser.add_argument('--segments', type=int, default=4, help='parallel scan segments')
+    parser.add_argument('--workers', type=int, default=4, help='segments scanned at the same time')
+    parser.add_argument('--page-size', type=int, default=100, help='items read per scan request')
+    parser.add_argument('--restart', action='store_true', help='discard any previous export in the output directory')
+    args = parser.parse_args(argv)
+
+    repository = DynamoDBUserRepository(args.table)
+    try:
+        manifest = export_users(repository, args.output, args.segments, args.workers, args.page_size, args.restart)
+    except FileExistsError as e:
+        parser.exit(1, 'error: %s, pass --restart to export again\n' % e)
+    print('Exported %d users (%d this run) in %.1fs, %s items/s' %
+          (manifest['items'], manifest['exported_this_run'], manifest['seconds'], manifest['items_per_second']))
+
+
+if __name__ == '__main__':
+    main()
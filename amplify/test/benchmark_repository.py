@@ -0,0 +1,85 @@
+"""
+Per-request CPU time of the email lookup, resource layer against the
+low-level client used by DynamoDBUserRepository.
+
+DynamoDB answers are canned responses served from botocore's before-send
+hook, so the numbers cover request building, response parsing and
+unmarshalling only, with no network or moto in the way.
+
+    python test/benchmark_repository.py [iterations]
+"""
+import json
+import os
+import sys
+import time
+import uuid
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.awsrequest import AWSResponse
+from conftest import import_module
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+TABLE = 'users-dev'
+EMAIL = 'test@example.com'
+
+
+class CannedBody:
+
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+def serve(client, payload):
+    body = json.dumps(payload).encode()
+
+    def respond(request, **kwargs):
+        return AWSResponse(request.url, 200, {'x-amzn-requestid': 'benchmark', 'content-type': 'application/x-amz-json-1.0'},
+                           CannedBody(body))
+
+    client.meta.events.register('before-send.dynamodb', respond)
+
+
+def measure(lookup, iterations):
+    lookup()
+    start = time.process_time()
+    for _ in range(iterations):
+        lookup()
+    return (time.process_time() - start) / iterations
+
+
+def main(iterations):
+    item = {'id': {'S': str(uuid.uuid4())}, 'email': {'S': EMAIL}, 'name': {'S': 'Jean Dupont'}, 'version': {'N': '3'}}
+    payload = {'Count': 1, 'ScannedCount': 1, 'Items': [item]}
+
+    table = boto3.resource('dynamodb').Table(TABLE)
+    serve(table.meta.client, payload)
+
+    client = boto3.client('dynamodb')
+    serve(client, payload)
+    repository = import_module('userGet', 'repository').DynamoDBUserRepository(TABLE, client)
+
+    def resource_lookup():
+        return table.query(IndexName='email', KeyConditionExpression=Key('email').eq(EMAIL))['Items'][0]
+
+    def client_lookup():
+        return repository.get_by_email(EMAIL)
+
+    assert resource_lookup()['email'] == client_lookup()['email'] == EMAIL
+
+    resource_time = measure(resource_lookup, iterations)
+    client_time = measure(client_lookup, iterations)
+    print('%d lookups' % iterations)
+    print('resource layer   %8.1f us/request' % (resource_time * 1e6))
+    print('client + marshal %8.1f us/request' % (client_time * 1e6))
+    print('speedup          %8.2fx' % (resource_time / client_time))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,42 @@
+import importlib.util
+import os
+import sys
+
+FUNCTIONS_PATH = os.path.join(os.path.dirname(__file__), '..', 'backend', 'function')
+
+
+def load_module(name, path):
+    """
+    Execute the file at path as the module `name`, replacing any module
+    already imported under that name
+    """
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def import_module(function, name):
+    """
+    Import a module from a function's src directory. Each function ships its
+    own copy of the sibling modules, so copies imported earlier are dropped.
+    """
+    src_path = os.path.join(FUNCTIONS_PATH, function, 'src')
+    for filename in os.listdir(src_path):
+        if filename.endswith('.py'):
+            sys.modules.pop(filename[:-3], None)
+    sys.path.insert(0, src_path)
+    try:
+        return load_module(name, os.path.join(src_path, name + '.py'))
+    finally:
+        sys.path.remove(src_path)
+
+
+class FakeClock:
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
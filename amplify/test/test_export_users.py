@@ -0,0 +1,181 @@
+import gzip
+import hashlib
+import json
+import os
+import uuid
+
+import boto3
+import pytest
+from conftest import import_module, load_module
+from moto import mock_dynamodb
+
+# Set environment variables for the lambda
+os.environ['AWS_DEFAULT_REGION'] = 'eu-west-1'
+os.environ['USERS_TABLE'] = 'users-dev'
+
+EXPORT_SCRIPT = os.path.join(os.path.dirname(__file__), '..', 'scripts', 'export_users.py')
+
+
+def import_export():
+    """Import the script along with the repository module it uses"""
+    repository = import_module('userGet', 'repository')
+    return load_module('export_users', EXPORT_SCRIPT), repository
+
+
+def read_export(output, manifest):
+    users = []
+    for segment in manifest['segments']:
+        with gzip.open(os.path.join(output, segment['file']), 'rt') as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == segment['items']
+        users.extend(lines)
+    return users
+
+
+class CrashingRepository:
+    """Fails every scan after the first `pages` ones"""
+
+    def __init__(self, repository, pages):
+        self.repository = repository
+        self.pages = pages
+
+    def scan(self, *args):
+        if self.pages == 0:
+            raise RuntimeError('Simulated crash')
+        self.pages -= 1
+        return self.repository.scan(*args)
+
+
+class TestExportUsers:
+
+    def setup_method(self, method):
+        self.export, self.module = import_export()
+
+    def memory_repository(self, count):
+        repository = self.module.InMemoryUserRepository()
+        users = [{'id': str(uuid.uuid4()), 'email': f'user{i}@example.com', 'version': 1} for i in range(count)]
+        for user in users:
+            repository.put(user)
+        return repository, users
+
+    def test_export_memory_table(self, tmp_path):
+        repository, users = self.memory_repository(250)
+        manifest = self.export.export_users(repository, str(tmp_path), total_segments=4, workers=2, page_size=20)
+
+        assert manifest['items'] == 250
+        assert manifest['exported_this_run'] == 250
+        assert len(manifest['segments']) == 4
+        assert manifest['items_per_second'] > 0
+        assert sorted(read_export(str(tmp_path), manifest), key=lambda user: user['id']) == sorted(users, key=lambda user: user['id'])
+
+        with open(tmp_path / 'manifest.json') as f:
+            assert json.load(f) == manifest
+        for segment in manifest['segments']:
+            data = (tmp_path / segment['file']).read_bytes()
+            assert hashlib.sha256(data).hexdigest() == segment['sha256']
+            assert len(data) == segment['bytes']
+
+    def test_resume_after_crash(self, tmp_path):
+        repository, users = self.memory_repository(100)
+        with pytest.raises(RuntimeError):
+            self.export.export_users(CrashingRepository(repository, 3), str(tmp_path), total_segments=2, workers=1, page_size=10)
+        assert not (tmp_path / 'manifest.json').exists()
+
+        manifest = self.export.export_users(repository, str(tmp_path), total_segments=2, workers=1, page_size=10)
+        assert manifest['items'] == 100
+        assert manifest['exported_this_run'] == 100 - 30
+        exported = read_export(str(tmp_path), manifest)
+        assert len({user['id'] for user in exported}) == 100
+
+    def test_finished_export_is_not_reused(self, tmp_path):
+        repository, users = self.memory_repository(20)
+        self.export.export_users(repository, str(tmp_path), total_segments=2, workers=1)
+        with pytest.raises(FileExistsError):
+            self.export.export_users(CrashingRepository(repository, 0), str(tmp_path), total_segments=2, workers=1)
+
+        # A restart exports the table as it is now
+        repository.put({'id': str(uuid.uuid4()), 'email': 'new@example.com'})
+        manifest = self.export.export_users(repository, str(tmp_path), total_segments=3, workers=1, restart=True)
+        assert manifest['items'] == 21
+        assert manifest['exported_this_run'] == 21
+        assert len(read_export(str(tmp_path), manifest)) == 21
+        assert sorted(os.listdir(tmp_path)) == sorted(['manifest.json'] + [
+            'segment-%04d.%s' % (segment, suffix) for segment in range(3) for suffix in ['ndjson.gz', 'checkpoint.json']
+        ])
+
+    def test_cli_refuses_finished_export(self, tmp_path, capsys):
+        repository, _ = self.memory_repository(5)
+        self.export.export_users(repository, str(tmp_path))
+        with pytest.raises(SystemExit) as exit_info:
+            self.export.main(['--output', str(tmp_path)])
+        assert exit_info.value.code == 1
+        assert '--restart' in capsys.readouterr().err
+
+    def test_page_written_without_checkpoint_is_dropped(self, tmp_path):
+        repository, users = self.memory_repository(30)
+        with pytest.raises(RuntimeError):
+            self.export.export_users(CrashingRepository(repository, 1), str(tmp_path), total_segments=1, workers=1, page_size=10)
+
+        # Simulate a crash between writing a page and its checkpoint
+        data_path, _ = self.export.segment_paths(str(tmp_path), 0)
+        with open(data_path, 'ab') as f:
+            f.write(gzip.compress(json.dumps(users[0]).encode() + b'\n'))
+
+        manifest = self.export.export_users(repository, str(tmp_path), total_segments=1, workers=1, page_size=10)
+        exported = read_export(str(tmp_path), manifest)
+        assert len(exported) == 30
+        assert len({user['id'] for user in exported}) == 30
+
+    @pytest.mark.parametrize("damage", ['remove', 'shorten'])
+    def test_data_file_behind_checkpoint(self, tmp_path, damage):
+        repository, _ = self.memory_repository(30)
+        with pytest.raises(RuntimeError):
+            self.export.export_users(CrashingRepository(repository, 1), str(tmp_path), total_segments=1, workers=1, page_size=10)
+
+        data_path, _ = self.export.segment_paths(str(tmp_path), 0)
+        if damage == 'remove':
+            os.remove(data_path)
+        else:
+            with open(data_path, 'ab') as f:
+                f.truncate(os.path.getsize(data_path) - 1)
+
+        with pytest.raises(ValueError, match='disagree'):
+            self.export.export_users(repository, str(tmp_path), total_segments=1, workers=1, page_size=10)
+        assert not (tmp_path / 'manifest.json').exists()
+
+    def test_segment_count_must_match_checkpoints(self, tmp_path):
+        repository, _ = self.memory_repository(10)
+        with pytest.raises(RuntimeError):
+            self.export.export_users(CrashingRepository(repository, 1), str(tmp_path), total_segments=2, workers=1)
+        with pytest.raises(ValueError):
+            self.export.export_users(repository, str(tmp_path), total_segments=3, workers=1)
+
+    @mock_dynamodb
+    def test_export_dynamodb_table(self, tmp_path):
+        dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+        table = dynamodb.create_table(TableName='users-dev',
+                                      KeySchema=[{
+                                          'AttributeName': 'id',
+                                          'KeyType': 'HASH'
+                                      }],
+                                      AttributeDefinitions=[{
+                                          'AttributeName': 'id',
+                                          'AttributeType': 'S'
+                                      }],
+                                      BillingMode='PAY_PER_REQUEST')
+        users = [{'id': str(uuid.uuid4()), 'email': f'user{i}@example.com', 'name': 'Jean Dupont', 'version': 2} for i in range(60)]
+        with table.batch_writer() as batch:
+            for user in users:
+                batch.put_item(Item=user)
+
+        repository = self.module.DynamoDBUserRepository('users-dev', boto3.client('dynamodb', region_name='eu-west-1'))
+        # moto ignores Segment and TotalSegments, so a single segment is scanned
+        manifest = self.export.export_users(repository, str(tmp_path), total_segments=1, workers=1, page_size=7)
+        assert manifest['items'] == 60
+        exported = read_export(str(tmp_path), manifest)
+        assert sorted(exported, key=lambda user: user['id']) == sorted(users, key=lambda user: user['id'])
+
+        # The command line always reads the DynamoDB table
+        self.export.main(['--table', 'users-dev', '--output', str(tmp_path), '--segments', '1', '--restart'])
+        with open(tmp_path / 'manifest.json') as f:
+            assert json.load(f)['items'] == 60
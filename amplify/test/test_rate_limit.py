@@ -0,0 +1,176 @@
+import filecmp
+import json
+import os
+
+import boto3
+import pytest
+from botocore.config import Config
+from botocore.exceptions import EndpointConnectionError
+from conftest import FUNCTIONS_PATH, FakeClock, import_module
+from moto import mock_dynamodb
+
+# Set environment variables for the lambda
+os.environ['AWS_DEFAULT_REGION'] = 'eu-west-1'
+os.environ['USERS_TABLE'] = 'users-dev'
+
+
+def event_from(source_ip, **kwargs):
+    return dict({'requestContext': {'identity': {'sourceIp': source_ip}}}, **kwargs)
+
+
+def test_function_copies_match():
+    """Test that every function ships the same rate_limit module"""
+    assert filecmp.cmp(os.path.join(FUNCTIONS_PATH, 'userAdd', 'src', 'rate_limit.py'),
+                       os.path.join(FUNCTIONS_PATH, 'userGet', 'src', 'rate_limit.py'),
+                       shallow=False)
+
+
+class TestRateLimiter:
+
+    def setup_method(self, method):
+        self.module = import_module('userGet', 'rate_limit')
+        self.clock = FakeClock(1000.0)
+
+    def test_token_bucket_burst_and_refill(self):
+        limiter = self.module.RateLimiter('get', rate=2, burst=3, clock=self.clock)
+        assert [limiter.check('ip:1.2.3.4') for _ in range(3)] == [0, 0, 0]
+        assert limiter.check('ip:1.2.3.4') == pytest.approx(0.5)
+
+        self.clock.now += 0.5
+        assert limiter.check('ip:1.2.3.4') == 0
+        assert limiter.check('ip:1.2.3.4') > 0
+
+    def test_clients_are_independent(self):
+        limiter = self.module.RateLimiter('get', rate=1, burst=1, clock=self.clock)
+        assert limiter.check('ip:1.2.3.4') == 0
+        assert limiter.check('ip:1.2.3.4') > 0
+        assert limiter.check('ip:5.6.7.8') == 0
+
+    def test_tracked_clients_are_bounded(self, monkeypatch):
+        monkeypatch.setattr(self.module, 'MAX_TRACKED_CLIENTS', 2)
+        limiter = self.module.RateLimiter('get', rate=1, burst=1, clock=self.clock)
+        for client in ['a', 'b', 'c']:
+            limiter.check(client)
+        assert list(limiter._buckets) == ['b', 'c']
+
+    def test_shared_limit(self):
+        store = self.module.InMemoryCounterStore()
+        # Two containers share the store but have their own buckets
+        limiters = [
+            self.module.RateLimiter('get', rate=100, burst=100, store=store, shared_limit=3, window=60, clock=self.clock)
+            for _ in range(2)
+        ]
+        assert [limiters[i % 2].check('ip:1.2.3.4') for i in range(3)] == [0, 0, 0]
+        assert limiters[0].check('ip:1.2.3.4') == pytest.approx(20)
+        assert limiters[1].check('ip:1.2.3.4') == pytest.approx(20)
+
+        # A new window starts a new count
+        self.clock.now += 20
+        assert limiters[1].check('ip:1.2.3.4') == 0
+
+    @mock_dynamodb
+    def test_dynamodb_counter_store(self):
+        dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+        dynamodb.create_table(TableName='rate-limits-dev',
+                              KeySchema=[{
+                                  'AttributeName': 'id',
+                                  'KeyType': 'HASH'
+                              }],
+                              AttributeDefinitions=[{
+                                  'AttributeName': 'id',
+                                  'AttributeType': 'S'
+                              }],
+                              BillingMode='PAY_PER_REQUEST')
+        store = self.module.DynamoDBCounterStore('rate-limits-dev', dynamodb)
+        assert [store.increment('get#ip:1.2.3.4#960', 2, 1020) for _ in range(3)] == [True, True, False]
+        assert store.increment('get#ip:5.6.7.8#960', 2, 1020)
+
+        item = dynamodb.Table('rate-limits-dev').get_item(Key={'id': 'get#ip:1.2.3.4#960'})['Item']
+        assert item['count'] == 2
+        assert item['expires_at'] == 1020
+
+    @mock_dynamodb
+    def test_counter_errors_fail_open(self):
+        store = self.module.DynamoDBCounterStore('missing-table', boto3.resource('dynamodb', region_name='eu-west-1'))
+        limiter = self.module.RateLimiter('get', rate=1, burst=1, store=store, shared_limit=1, clock=self.clock)
+        assert limiter.check('ip:1.2.3.4') == 0
+
+    def test_unreachable_counter_fails_open(self):
+        # No retries, the connection would be refused every time
+        resource = boto3.resource('dynamodb', region_name='eu-west-1', config=Config(retries={'total_max_attempts': 1}))
+        store = self.module.DynamoDBCounterStore('rate-limits-dev', resource)
+        store.table.meta.client.meta.events.register('before-send.dynamodb', self.refuse_connection)
+        limiter = self.module.RateLimiter('get', rate=1, burst=1, store=store, shared_limit=1, clock=self.clock)
+        assert limiter.check('ip:1.2.3.4') == 0
+        # The local bucket still limits the client
+        assert limiter.check('ip:1.2.3.4') > 0
+
+    @staticmethod
+    def refuse_connection(request, **kwargs):
+        raise EndpointConnectionError(endpoint_url=request.url)
+
+    @pytest.mark.parametrize("event, key", [
+        ({'requestContext': {'identity': {'apiKey': 'abc', 'sourceIp': '1.2.3.4'}}}, 'key:abc'),
+        ({'requestContext': {'identity': {'apiKey': None, 'sourceIp': '1.2.3.4'}}}, 'ip:1.2.3.4'),
+        ({'requestContext': {'http': {'sourceIp': '1.2.3.4'}}}, 'ip:1.2.3.4'),
+        ({}, 'ip:unknown'),
+    ])
+    def test_client_key(self, event, key):
+        assert self.module.client_key(event) == key
+
+    def test_retry_after(self):
+        assert self.module.retry_after(0.2) == '1'
+        assert self.module.retry_after(2.5) == '3'
+
+    def test_build_rate_limiter(self, monkeypatch):
+        monkeypatch.delenv('RATE_LIMIT_GET_RATE', raising=False)
+        limiter = self.module.build_rate_limiter('get', default_rate=10, default_burst=20)
+        assert (limiter.rate, limiter.burst, limiter.store) == (10, 20, None)
+
+        monkeypatch.setenv('RATE_LIMIT_GET_RATE', '0')
+        assert self.module.build_rate_limiter('get', default_rate=10, default_burst=20) is None
+
+        monkeypatch.setenv('RATE_LIMIT_GET_RATE', '5')
+        monkeypatch.setenv('RATE_LIMIT_GET_SHARED_LIMIT', '100')
+        monkeypatch.setenv('RATE_LIMIT_TABLE', 'rate-limits-dev')
+        limiter = self.module.build_rate_limiter('get', default_rate=10, default_burst=20)
+        assert limiter.rate == 5
+        assert limiter.shared_limit == 100
+        assert isinstance(limiter.store, self.module.DynamoDBCounterStore)
+
+
+class TestHandlersRateLimited:
+    """The users table is never created: a limited request must not reach it"""
+
+    @pytest.fixture(autouse=True)
+    def handlers(self, monkeypatch):
+        # Other test modules turn the limiters off
+        for route in ['GET', 'ADD']:
+            monkeypatch.setenv('RATE_LIMIT_%s_RATE' % route, '1')
+            monkeypatch.setenv('RATE_LIMIT_%s_BURST' % route, '1')
+        self.get_module = import_module('userGet', 'index')
+        self.add_module = import_module('userAdd', 'index')
+
+    @mock_dynamodb
+    def test_get_rate_limited(self):
+        # Validation errors still spend a token
+        response = self.get_module.get(event_from('1.2.3.4', queryStringParameters=None), {})
+        assert response['statusCode'] == 400
+
+        response = self.get_module.get(event_from('1.2.3.4', queryStringParameters={'email': 'test@example.com'}), {})
+        assert response['statusCode'] == 429
+        assert response['headers']['Retry-After'] == '1'
+        assert response['headers']['Access-Control-Allow-Origin'] == '*'
+        assert json.loads(response['body']) == {'error': 'Too many requests'}
+
+        # Another client is not affected
+        response = self.get_module.get(event_from('5.6.7.8', queryStringParameters=None), {})
+        assert response['statusCode'] == 400
+
+    @mock_dynamodb
+    def test_add_rate_limited_before_validation(self):
+        assert self.add_module.add(event_from('1.2.3.4'), {})['statusCode'] == 400
+
+        response = self.add_module.add(event_from('1.2.3.4', body='invalid json'), {})
+        assert response['statusCode'] == 429
+        assert int(response['headers']['Retry-After']) >= 1
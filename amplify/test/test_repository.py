@@ -0,0 +1,407 @@
+import filecmp
+import json
+import os
+import uuid
+from decimal import Decimal
+
+import boto3
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+from conftest import FUNCTIONS_PATH, FakeClock, import_module
+from moto import mock_dynamodb
+
+# Set environment variables for the lambda
+os.environ['AWS_DEFAULT_REGION'] = 'eu-west-1'
+os.environ['USERS_TABLE'] = 'users-dev'
+# Rate limiting has its own tests in test_rate_limit.py
+os.environ['RATE_LIMIT_ADD_RATE'] = '0'
+os.environ['RATE_LIMIT_GET_RATE'] = '0'
+
+
+def setup_table():
+    dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+    table = dynamodb.create_table(TableName='users-dev',
+                                  KeySchema=[{
+                                      'AttributeName': 'id',
+                                      'KeyType': 'HASH'
+                                  }],
+                                  AttributeDefinitions=[{
+                                      'AttributeName': 'id',
+                                      'AttributeType': 'S'
+                                  }, {
+                                      'AttributeName': 'email',
+                                      'AttributeType': 'S'
+                                  }],
+                                  GlobalSecondaryIndexes=[{
+                                      'IndexName': 'email',
+                                      'KeySchema': [{
+                                          'AttributeName': 'email',
+                                          'KeyType': 'HASH'
+                                      }],
+                                      'Projection': {
+                                          'ProjectionType': 'ALL'
+                                      }
+                                  }],
+                                  BillingMode='PAY_PER_REQUEST')
+    table.meta.client.get_waiter('table_exists').wait(TableName='users-dev')
+    return table
+
+
+@pytest.mark.parametrize("function", ['userGet', 'userUpdate'])
+@pytest.mark.parametrize("filename", ['repository.py', 'http_headers.py'])
+def test_function_copies_match(function, filename):
+    """Test that every function ships the same shared modules"""
+    assert filecmp.cmp(os.path.join(FUNCTIONS_PATH, 'userAdd', 'src', filename),
+                       os.path.join(FUNCTIONS_PATH, function, 'src', filename),
+                       shallow=False)
+
+
+@pytest.fixture
+def module():
+    return import_module('userAdd', 'repository')
+
+
+@pytest.fixture(params=['dynamodb', 'memory'])
+def repository(request, module):
+    if request.param == 'memory':
+        yield module.InMemoryUserRepository()
+        return
+    with mock_dynamodb():
+        setup_table()
+        yield module.DynamoDBUserRepository('users-dev', boto3.client('dynamodb', region_name='eu-west-1'))
+
+
+class TestUserRepository:
+
+    def test_create_and_get(self, repository):
+        user = {'id': str(uuid.uuid4()), 'email': 'test@example.com', 'name': 'Jean Dupont'}
+        assert repository.create_if_absent(user)
+        assert repository.get_by_email('test@example.com') == user
+        assert repository.get_by_id(user['id']) == user
+
+    def test_missing_user(self, repository):
+        assert repository.get_by_email('nonexistent@example.com') is None
+        assert repository.get_by_id(str(uuid.uuid4())) is None
+
+    def test_email_uniqueness(self, repository):
+        assert repository.create_if_absent({'id': str(uuid.uuid4()), 'email': 'test@example.com'})
+        duplicate = {'id': str(uuid.uuid4()), 'email': 'test@example.com'}
+        assert not repository.create_if_absent(duplicate)
+        assert repository.get_by_id(duplicate['id']) is None
+
+    def test_existing_id(self, repository):
+        user = {'id': str(uuid.uuid4()), 'email': 'first@example.com'}
+        assert repository.create_if_absent(user)
+        assert not repository.create_if_absent({'id': user['id'], 'email': 'second@example.com'})
+        assert repository.get_by_id(user['id']) == user
+        # The rejected email stays free
+        assert repository.create_if_absent({'id': str(uuid.uuid4()), 'email': 'second@example.com'})
+
+    def test_email_case_sensitive(self, repository):
+        assert repository.create_if_absent({'id': str(uuid.uuid4()), 'email': 'test@example.com'})
+        assert repository.create_if_absent({'id': str(uuid.uuid4()), 'email': 'TEST@EXAMPLE.COM'})
+
+    def test_update(self, repository):
+        user = {'id': str(uuid.uuid4()), 'email': 'test@example.com', 'name': 'Jean Dupont', 'version': 1}
+        repository.create_if_absent(user)
+
+        updated = repository.update(user['id'], {'name': 'Marie Curie'}, expected_version=1)
+        assert updated == dict(user, name='Marie Curie', version=2)
+        assert repository.get_by_email('test@example.com') == updated
+
+        updated = repository.update(user['id'], {'name': None})
+        assert updated == {'id': user['id'], 'email': 'test@example.com', 'version': 3}
+
+    def test_update_version_conflict(self, repository, module):
+        user = {'id': str(uuid.uuid4()), 'email': 'test@example.com', 'version': 2}
+        repository.create_if_absent(user)
+        with pytest.raises(module.VersionConflictError):
+            repository.update(user['id'], {'name': 'Marie Curie'}, expected_version=1)
+        assert repository.get_by_id(user['id']) == user
+
+    def test_update_unversioned_user(self, repository, module):
+        user = {'id': str(uuid.uuid4()), 'email': 'test@example.com'}
+        repository.create_if_absent(user)
+        with pytest.raises(module.VersionConflictError):
+            repository.update(user['id'], {'name': 'Marie Curie'}, expected_version=1)
+        assert repository.update(user['id'], {'name': 'Marie Curie'}, expected_version=0)['version'] == 1
+
+    def test_update_missing_user(self, repository, module):
+        with pytest.raises(module.UserNotFoundError):
+            repository.update(str(uuid.uuid4()), {'name': 'Marie Curie'})
+        assert repository.get_by_email('test@example.com') is None
+
+    def test_scan_returns_only_users(self, repository):
+        users = [{'id': str(uuid.uuid4()), 'email': f'user{i}@example.com'} for i in range(5)]
+        for user in users:
+            repository.create_if_absent(user)
+        scanned, last_key = repository.scan(0, 1)
+        assert last_key is None
+        assert sorted(scanned, key=lambda user: user['id']) == sorted(users, key=lambda user: user['id'])
+
+    def test_batch_get(self, repository):
+        users = [{'id': str(uuid.uuid4()), 'email': f'user{i}@example.com'} for i in range(3)]
+        for user in users:
+            repository.create_if_absent(user)
+        user_ids = [users[2]['id'], str(uuid.uuid4()), users[0]['id'], users[2]['id']]
+        assert repository.batch_get(user_ids) == [users[2], users[0]]
+
+    def test_batch_create_if_absent(self, repository):
+        existing = {'id': str(uuid.uuid4()), 'email': 'existing@example.com'}
+        repository.create_if_absent(existing)
+        users = [
+            {'id': str(uuid.uuid4()), 'email': 'new@example.com'},
+            {'id': str(uuid.uuid4()), 'email': 'existing@example.com'},
+            {'id': str(uuid.uuid4()), 'email': 'new@example.com'},
+        ]
+        created = repository.batch_create_if_absent(users)
+        assert created == [users[0]]
+        assert repository.get_by_email('new@example.com') == users[0]
+        assert repository.get_by_email('existing@example.com') == existing
+
+
+class TestDynamoDBUserRepository:
+
+    @mock_dynamodb
+    def test_uniqueness_without_index(self):
+        """Test that a concurrent add the email index cannot see yet is rejected"""
+        setup_table()
+        module = import_module('userAdd', 'repository')
+        repository = module.DynamoDBUserRepository('users-dev', boto3.client('dynamodb', region_name='eu-west-1'))
+        assert repository.create_if_absent({'id': str(uuid.uuid4()), 'email': 'test@example.com'})
+
+        # Both requests passed the index check before either was written
+        repository.get_by_email = lambda email: None
+        duplicate = {'id': str(uuid.uuid4()), 'email': 'test@example.com'}
+        assert not repository.create_if_absent(duplicate)
+        assert repository.get_by_id(duplicate['id']) is None
+
+    @pytest.mark.parametrize("reasons", [
+        ['None', 'TransactionConflict'],
+        ['TransactionConflict', 'None'],
+        ['ConditionalCheckFailed', 'None'],
+    ])
+    def test_cancelled_transaction(self, reasons):
+        """Test that an add cancelled by an overlapping one reports the email as taken"""
+        module = import_module('userAdd', 'repository')
+        client = boto3.client('dynamodb', region_name='eu-west-1')
+        repository = module.DynamoDBUserRepository('users-dev', client)
+        with Stubber(client) as stubber:
+            stubber.add_response('query', {'Items': []})
+            stubber.add_client_error('transact_write_items',
+                                     service_error_code='TransactionCanceledException',
+                                     modeled_fields={'CancellationReasons': [{'Code': code} for code in reasons]})
+            assert repository.create_if_absent({'id': str(uuid.uuid4()), 'email': 'test@example.com'}) is False
+
+    def test_other_cancellations_are_raised(self):
+        module = import_module('userAdd', 'repository')
+        client = boto3.client('dynamodb', region_name='eu-west-1')
+        repository = module.DynamoDBUserRepository('users-dev', client)
+        with Stubber(client) as stubber:
+            stubber.add_response('query', {'Items': []})
+            stubber.add_client_error('transact_write_items',
+                                     service_error_code='TransactionCanceledException',
+                                     modeled_fields={'CancellationReasons': [{'Code': 'ThrottlingError'}, {'Code': 'None'}]})
+            with pytest.raises(ClientError):
+                repository.create_if_absent({'id': str(uuid.uuid4()), 'email': 'test@example.com'})
+
+    def sentinel_setup(self):
+        setup_table()
+        module = import_module('userAdd', 'repository')
+        repository = module.DynamoDBUserRepository('users-dev', boto3.client('dynamodb', region_name='eu-west-1'))
+        user = {'id': str(uuid.uuid4()), 'email': 'test@example.com'}
+        assert repository.create_if_absent(user)
+        return module, repository, user
+
+    @mock_dynamodb
+    def test_sentinel_is_not_a_user(self):
+        _, repository, _ = self.sentinel_setup()
+        assert repository.get_by_id('email#test@example.com') is None
+
+    @mock_dynamodb
+    def test_batch_get_skips_sentinels(self):
+        _, repository, user = self.sentinel_setup()
+        assert repository.batch_get(['email#test@example.com', user['id']]) == [user]
+
+    @mock_dynamodb
+    def test_update_sentinel(self):
+        module, repository, user = self.sentinel_setup()
+        with pytest.raises(module.UserNotFoundError):
+            repository.update('email#test@example.com', {'name': 'Marie Curie'})
+        item = boto3.resource('dynamodb', region_name='eu-west-1').Table('users-dev').get_item(Key={'id': 'email#test@example.com'})['Item']
+        assert item == {'id': 'email#test@example.com', 'user_id': user['id']}
+
+
+class TestHttpHeaders:
+
+    def setup_method(self, method):
+        self.module = import_module('userAdd', 'http_headers')
+
+    def test_etag_round_trip(self):
+        user_id = str(uuid.uuid4())
+        etag = self.module.make_etag(user_id, 7)
+        assert etag.startswith('"7-') and etag.endswith('"')
+        assert self.module.parse_etag(user_id, etag) == 7
+        assert self.module.parse_etag(user_id, ' ' + etag + ' ') == 7
+
+    @pytest.mark.parametrize("etag", ['"garbage"', '"7-0000"', 'W/"7"', ''])
+    def test_parse_foreign_etag(self, etag):
+        assert self.module.parse_etag(str(uuid.uuid4()), etag) is None
+
+    def test_parse_etag_of_other_user(self):
+        assert self.module.parse_etag(str(uuid.uuid4()), self.module.make_etag(str(uuid.uuid4()), 1)) is None
+
+    def test_etag_matches(self):
+        etag = self.module.make_etag(str(uuid.uuid4()), 1)
+        assert self.module.etag_matches(etag, etag)
+        assert self.module.etag_matches('W/' + etag, etag)
+        assert self.module.etag_matches('"other", ' + etag, etag)
+        assert self.module.etag_matches('*', etag)
+        assert not self.module.etag_matches('"other"', etag)
+        assert not self.module.etag_matches(None, etag)
+
+    def test_get_header_ignores_case(self):
+        event = {'headers': {'If-None-Match': '*'}}
+        assert self.module.get_header(event, 'if-none-match') == '*'
+        assert self.module.get_header(event, 'If-Match') is None
+        assert self.module.get_header({'headers': None}, 'If-Match') is None
+
+
+class TestMarshaller:
+
+    def setup_method(self, method):
+        self.module = import_module('userAdd', 'repository')
+
+    def test_user_round_trip(self):
+        user = {'id': str(uuid.uuid4()), 'email': 'test@example.com', 'name': 'Jean Dupont', 'version': 3}
+        item = self.module.serialize_item(user)
+        assert item == {
+            'id': {'S': user['id']},
+            'email': {'S': 'test@example.com'},
+            'name': {'S': 'Jean Dupont'},
+            'version': {'N': '3'},
+        }
+        assert self.module.deserialize_item(item) == user
+
+    @pytest.mark.parametrize("wire, value", [
+        ({'N': '42'}, 42),
+        ({'N': '-7'}, -7),
+        ({'N': '1.5'}, Decimal('1.5')),
+        ({'N': '1E+3'}, Decimal('1E+3')),
+    ])
+    def test_numbers(self, wire, value):
+        result = self.module.deserialize_value(wire)
+        assert result == value
+        assert type(result) is type(value)
+
+    def test_matches_boto3_for_other_types(self):
+        """Test that values outside the user shape fall back to boto3"""
+        serializer = TypeSerializer()
+        for value in [True, None, {'a': 'b'}, ['x', 1], {'s1', 's2'}, Decimal('2.5')]:
+            assert self.module.serialize_value(value) == serializer.serialize(value)
+            assert self.module.deserialize_value(serializer.serialize(value)) == value
+
+
+class TestInMemoryUserRepository:
+
+    def setup_method(self, method):
+        self.module = import_module('userAdd', 'repository')
+
+    def test_returned_items_are_copies(self):
+        repository = self.module.InMemoryUserRepository()
+        user = {'id': str(uuid.uuid4()), 'email': 'test@example.com'}
+        repository.create_if_absent(user)
+        user['name'] = 'Changed'
+        repository.get_by_email('test@example.com')['name'] = 'Changed'
+        assert 'name' not in repository.get_by_id(user['id'])
+
+    def test_index_lag(self):
+        """Test that the email index is eventually consistent"""
+        clock = FakeClock()
+        repository = self.module.InMemoryUserRepository(index_lag=1.0, clock=clock)
+        user = {'id': str(uuid.uuid4()), 'email': 'test@example.com'}
+        assert repository.create_if_absent(user)
+
+        # The base item is readable at once, the index is not
+        assert repository.get_by_id(user['id']) == user
+        assert repository.get_by_email('test@example.com') is None
+
+        # Taken emails are tracked apart from the lagging index
+        assert not repository.create_if_absent({'id': str(uuid.uuid4()), 'email': 'test@example.com'})
+
+        clock.now = 1.0
+        assert repository.get_by_email('test@example.com') == user
+        assert not repository.create_if_absent({'id': str(uuid.uuid4()), 'email': 'test@example.com'})
+
+    def test_put_reindexes_email(self):
+        repository = self.module.InMemoryUserRepository()
+        user = {'id': str(uuid.uuid4()), 'email': 'old@example.com'}
+        repository.put(user)
+        repository.put(dict(user, email='new@example.com'))
+        assert repository.get_by_email('old@example.com') is None
+        assert repository.get_by_email('new@example.com')['id'] == user['id']
+
+    def test_build_repository(self):
+        assert isinstance(self.module.build_repository('memory', 'users-dev'), self.module.InMemoryUserRepository)
+        assert isinstance(self.module.build_repository('dynamodb', 'users-dev'), self.module.DynamoDBUserRepository)
+        with pytest.raises(ValueError):
+            self.module.build_repository('redis', 'users-dev')
+
+
+class TestHandlersInMemory:
+
+    def setup_method(self, method):
+        os.environ['USERS_BACKEND'] = 'memory'
+        self.add_module = import_module('userAdd', 'index')
+        self.get_module = import_module('userGet', 'index')
+        self.update_module = import_module('userUpdate', 'index')
+        # The handlers share one store, as they would share the table. It
+        # comes from userUpdate, which catches the repository's exceptions.
+        self.add_module.repository = self.update_module.repository
+        self.get_module.repository = self.update_module.repository
+
+    def teardown_method(self, method):
+        del os.environ['USERS_BACKEND']
+
+    def test_add_then_get(self):
+        response = self.add_module.add({'body': json.dumps({'email': 'test@example.com', 'name': 'Jean Dupont'})}, {})
+        assert response['statusCode'] == 201
+        created = json.loads(response['body'])
+
+        response = self.get_module.get({'queryStringParameters': {'email': 'test@example.com'}}, {})
+        assert response['statusCode'] == 200
+        assert json.loads(response['body']) == created
+
+    def test_add_etag_revalidates_get(self):
+        response = self.add_module.add({'body': json.dumps({'email': 'test@example.com'})}, {})
+        etag = response['headers']['ETag']
+
+        event = {'queryStringParameters': {'email': 'test@example.com'}, 'headers': {'If-None-Match': etag}}
+        response = self.get_module.get(event, {})
+        assert response['statusCode'] == 304
+        assert response['headers']['ETag'] == etag
+
+    def test_add_duplicate_email(self):
+        event = {'body': json.dumps({'email': 'test@example.com'})}
+        assert self.add_module.add(event, {})['statusCode'] == 201
+        response = self.add_module.add(event, {})
+        assert response['statusCode'] == 409
+        assert json.loads(response['body']) == {'error': 'User with this email already exists'}
+
+    def test_get_not_found(self):
+        response = self.get_module.get({'queryStringParameters': {'email': 'nonexistent@example.com'}}, {})
+        assert response['statusCode'] == 404
+
+    def test_update_with_etag_from_get(self):
+        created = json.loads(self.add_module.add({'body': json.dumps({'email': 'test@example.com'})}, {})['body'])
+        etag = self.get_module.get({'queryStringParameters': {'email': 'test@example.com'}}, {})['headers']['ETag']
+
+        event = {'body': json.dumps({'id': created['id'], 'name': 'Jean Dupont'}), 'headers': {'If-Match': etag}}
+        response = self.update_module.update(event, {})
+        assert response['statusCode'] == 200
+
+        response = self.get_module.get({'queryStringParameters': {'email': 'test@example.com'}}, {})
+        assert json.loads(response['body'])['name'] == 'Jean Dupont'
+        assert self.update_module.update(event, {})['statusCode'] == 412
@@ -1,27 +1,21 @@
-import importlib.util
 import json
 import os
-import sys
 import uuid
 
 import boto3
 import pytest
+from conftest import import_module
 from moto import mock_dynamodb
 
 # Set environment variables for the lambda
 os.environ['AWS_DEFAULT_REGION'] = 'eu-west-1'
 os.environ['USERS_TABLE'] = 'users-dev'
+# Rate limiting has its own tests in test_rate_limit.py
+os.environ['RATE_LIMIT_ADD_RATE'] = '0'
 
 
 def import_add():
-    import os
-    import sys
-    index_path = os.path.join(os.path.dirname(__file__), '..', 'backend', 'function', 'userAdd', 'src', 'index.py')
-    spec = importlib.util.spec_from_file_location("index", index_path)
-    index = importlib.util.module_from_spec(spec)
-    sys.modules["index"] = index
-    spec.loader.exec_module(index)
-    return index.add
+    return import_module('userAdd', 'index').add
 
 
 class TestUserAdd:
@@ -97,6 +91,21 @@ class TestUserAdd:
         assert created['Item']['email'] == 'test@example.com'
         assert created['Item']['id'] == body['id']
 
+    @mock_dynamodb
+    def test_create_user_sets_version(self):
+        """Test that new users start at version 1 and get an ETag"""
+        self.table = self.setup_table()
+
+        event = {'body': json.dumps({'email': 'test@example.com'})}
+        response = self.add(event, {})
+        assert response['statusCode'] == 201
+        assert response['headers']['ETag'].startswith('"')
+
+        body = json.loads(response['body'])
+        assert 'version' not in body
+        created = self.table.get_item(Key={'id': body['id']})
+        assert created['Item']['version'] == 1
+
     @mock_dynamodb
     def test_create_user_missing_email(self):
         """Test missing email validation"""
@@ -1,27 +1,21 @@
-import importlib.util
 import json
 import os
-import sys
 import uuid
 
 import boto3
 import pytest
+from conftest import import_module
 from moto import mock_dynamodb
 
 # Set environment variables for the lambda
 os.environ['AWS_DEFAULT_REGION'] = 'eu-west-1'
 os.environ['USERS_TABLE'] = 'users-dev'
+# Rate limiting has its own tests in test_rate_limit.py
+os.environ['RATE_LIMIT_GET_RATE'] = '0'
 
 
 def import_get():
-    import os
-    import sys
-    index_path = os.path.join(os.path.dirname(__file__), '..', 'backend', 'function', 'userGet', 'src', 'index.py')
-    spec = importlib.util.spec_from_file_location("index", index_path)
-    index = importlib.util.module_from_spec(spec)
-    sys.modules["index"] = index
-    spec.loader.exec_module(index)
-    return index.get
+    return import_module('userGet', 'index').get
 
 
 class TestUserGet:
@@ -174,3 +168,49 @@ class TestUserGet:
         returned = json.loads(response['body'])
         assert returned['email'] == 'test@example.com'
         assert returned['id'] in [test_user1['id'], test_user2['id']]
+
+    @mock_dynamodb
+    def test_get_user_returns_etag(self):
+        table = self.setup_table()
+        test_user = {'id': str(uuid.uuid4()), 'email': 'test@example.com', 'version': 3}
+        table.put_item(Item=test_user)
+
+        event = {'queryStringParameters': {'email': 'test@example.com'}}
+        response = self.get(event, {})
+        assert response['statusCode'] == 200
+        etag = response['headers']['ETag']
+        assert etag.startswith('"') and etag.endswith('"')
+        # The version stays internal to the table
+        assert json.loads(response['body']) == {'id': test_user['id'], 'email': 'test@example.com'}
+
+        # A new version gives a new ETag
+        table.put_item(Item=dict(test_user, version=4))
+        response = self.get(event, {})
+        assert response['headers']['ETag'] != etag
+
+    @mock_dynamodb
+    def test_get_user_if_none_match(self):
+        table = self.setup_table()
+        table.put_item(Item={'id': str(uuid.uuid4()), 'email': 'test@example.com', 'version': 1})
+        event = {'queryStringParameters': {'email': 'test@example.com'}}
+        etag = self.get(event, {})['headers']['ETag']
+
+        for if_none_match in [etag, 'W/' + etag, '"other", ' + etag, '*']:
+            event = {'queryStringParameters': {'email': 'test@example.com'}, 'headers': {'if-none-match': if_none_match}}
+            response = self.get(event, {})
+            assert response['statusCode'] == 304
+            assert response['body'] == ''
+            assert response['headers']['ETag'] == etag
+            assert response['headers']['Access-Control-Allow-Origin'] == '*'
+
+        event = {'queryStringParameters': {'email': 'test@example.com'}, 'headers': {'If-None-Match': '"other"'}}
+        response = self.get(event, {})
+        assert response['statusCode'] == 200
+        assert json.loads(response['body'])['email'] == 'test@example.com'
+
+    @mock_dynamodb
+    def test_get_user_if_none_match_not_found(self):
+        self.setup_table()
+        event = {'queryStringParameters': {'email': 'test@example.com'}, 'headers': {'If-None-Match': '*'}}
+        response = self.get(event, {})
+        assert response['statusCode'] == 404
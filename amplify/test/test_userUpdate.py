@@ -0,0 +1,206 @@
+import json
+import os
+import uuid
+
+import boto3
+import pytest
+from conftest import import_module
+from moto import mock_dynamodb
+
+# Set environment variables for the lambda
+os.environ['AWS_DEFAULT_REGION'] = 'eu-west-1'
+os.environ['USERS_TABLE'] = 'users-dev'
+# Rate limiting has its own tests in test_rate_limit.py
+os.environ['RATE_LIMIT_ADD_RATE'] = '0'
+
+
+def import_update():
+    return import_module('userUpdate', 'index').update
+
+
+class TestUserUpdate:
+
+    def setup_method(self, method):
+        self.update = import_update()
+
+    def setup_table(self):
+        dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+        table = dynamodb.create_table(TableName='users-dev',
+                                      KeySchema=[{
+                                          'AttributeName': 'id',
+                                          'KeyType': 'HASH'
+                                      }],
+                                      AttributeDefinitions=[{
+                                          'AttributeName': 'id',
+                                          'AttributeType': 'S'
+                                      }, {
+                                          'AttributeName': 'email',
+                                          'AttributeType': 'S'
+                                      }],
+                                      GlobalSecondaryIndexes=[{
+                                          'IndexName': 'email',
+                                          'KeySchema': [{
+                                              'AttributeName': 'email',
+                                              'KeyType': 'HASH'
+                                          }],
+                                          'Projection': {
+                                              'ProjectionType': 'ALL'
+                                          },
+                                          'ProvisionedThroughput': {
+                                              'ReadCapacityUnits': 5,
+                                              'WriteCapacityUnits': 5
+                                          }
+                                      }],
+                                      BillingMode='PROVISIONED',
+                                      ProvisionedThroughput={
+                                          'ReadCapacityUnits': 5,
+                                          'WriteCapacityUnits': 5
+                                      })
+        table.meta.client.get_waiter('table_exists').wait(TableName='users-dev')
+        return table
+
+    def put_user(self, table, **attributes):
+        user = dict({'id': str(uuid.uuid4()), 'email': 'test@example.com', 'version': 1}, **attributes)
+        table.put_item(Item=user)
+        return user
+
+    @mock_dynamodb
+    def test_update_name_success(self):
+        table = self.setup_table()
+        user = self.put_user(table, name='Jean Dupont')
+
+        event = {'httpMethod': 'PATCH', 'body': json.dumps({'id': user['id'], 'name': '  Marie Curie  '})}
+        response = self.update(event, {})
+        assert response['statusCode'] == 200
+        assert response['headers']['Access-Control-Allow-Origin'] == '*'
+        assert 'ETag' in response['headers']
+
+        # The updated attributes come back without another read
+        body = json.loads(response['body'])
+        assert body == {'id': user['id'], 'email': 'test@example.com', 'name': 'Marie Curie'}
+
+        stored = table.get_item(Key={'id': user['id']})['Item']
+        assert stored['name'] == 'Marie Curie'
+        assert stored['version'] == 2
+
+    @mock_dynamodb
+    def test_update_empty_name_removes_it(self):
+        table = self.setup_table()
+        user = self.put_user(table, name='Jean Dupont')
+
+        response = self.update({'body': json.dumps({'id': user['id'], 'name': ''})}, {})
+        assert response['statusCode'] == 200
+        assert 'name' not in json.loads(response['body'])
+        assert 'name' not in table.get_item(Key={'id': user['id']})['Item']
+
+    @mock_dynamodb
+    def test_update_unversioned_user(self):
+        table = self.setup_table()
+        user = {'id': str(uuid.uuid4()), 'email': 'test@example.com'}
+        table.put_item(Item=user)
+
+        response = self.update({'body': json.dumps({'id': user['id'], 'name': 'Marie Curie'})}, {})
+        assert response['statusCode'] == 200
+        assert table.get_item(Key={'id': user['id']})['Item']['version'] == 1
+
+    @mock_dynamodb
+    def test_update_ignores_other_fields(self):
+        table = self.setup_table()
+        user = self.put_user(table)
+
+        event = {'body': json.dumps({'id': user['id'], 'name': 'Marie Curie', 'email': 'other@example.com', 'admin': True})}
+        response = self.update(event, {})
+        assert response['statusCode'] == 200
+        body = json.loads(response['body'])
+        assert body['email'] == 'test@example.com'
+        assert 'admin' not in body
+
+    @mock_dynamodb
+    def test_update_name_too_long(self):
+        table = self.setup_table()
+        user = self.put_user(table)
+
+        response = self.update({'body': json.dumps({'id': user['id'], 'name': 'A' * 101})}, {})
+        assert response['statusCode'] == 400
+        assert json.loads(response['body']) == {'error': 'Name must be less than 100 characters'}
+        assert table.get_item(Key={'id': user['id']})['Item']['version'] == 1
+
+    @mock_dynamodb
+    @pytest.mark.parametrize("body, error", [
+        (None, 'Request body is required'),
+        ('invalid json', 'Invalid JSON in request body'),
+        (json.dumps({'name': 'Marie Curie'}), 'User id is required'),
+        (json.dumps({'id': '  ', 'name': 'Marie Curie'}), 'User id is required'),
+        (json.dumps({'id': 'some-id'}), 'No fields to update'),
+    ])
+    def test_update_invalid_request(self, body, error):
+        self.setup_table()
+        response = self.update({'body': body}, {})
+        assert response['statusCode'] == 400
+        assert json.loads(response['body']) == {'error': error}
+
+    @mock_dynamodb
+    def test_update_user_not_found(self):
+        table = self.setup_table()
+        user_id = str(uuid.uuid4())
+        response = self.update({'body': json.dumps({'id': user_id, 'name': 'Marie Curie'})}, {})
+        assert response['statusCode'] == 404
+        assert json.loads(response['body']) == {'error': 'User not found'}
+        # UpdateItem must not have created the user
+        assert 'Item' not in table.get_item(Key={'id': user_id})
+
+    @mock_dynamodb
+    def test_update_email_sentinel(self):
+        table = self.setup_table()
+        add = import_module('userAdd', 'index').add
+        response = add({'body': json.dumps({'email': 'victim@example.com'})}, {})
+        assert response['statusCode'] == 201
+
+        # The sentinel guarding the email is not a user
+        response = self.update({'body': json.dumps({'id': 'email#victim@example.com', 'name': 'Marie Curie'})}, {})
+        assert response['statusCode'] == 404
+        assert json.loads(response['body']) == {'error': 'User not found'}
+        assert 'name' not in table.get_item(Key={'id': 'email#victim@example.com'})['Item']
+
+    @mock_dynamodb
+    def test_update_if_match(self):
+        table = self.setup_table()
+        user = self.put_user(table)
+        response = self.update({'body': json.dumps({'id': user['id'], 'name': 'Jean Dupont'})}, {})
+        etag = response['headers']['ETag']
+
+        event = {'body': json.dumps({'id': user['id'], 'name': 'Marie Curie'}), 'headers': {'if-match': etag}}
+        response = self.update(event, {})
+        assert response['statusCode'] == 200
+        assert response['headers']['ETag'] != etag
+
+        # The same ETag is now stale
+        response = self.update(event, {})
+        assert response['statusCode'] == 412
+        assert json.loads(response['body']) == {'error': 'User was modified by another request'}
+        assert table.get_item(Key={'id': user['id']})['Item']['name'] == 'Marie Curie'
+
+    @mock_dynamodb
+    @pytest.mark.parametrize("if_match", ['"garbage"', '"2-0000"', 'W/"1"'])
+    def test_update_if_match_foreign_etag(self, if_match):
+        table = self.setup_table()
+        user = self.put_user(table)
+        event = {'body': json.dumps({'id': user['id'], 'name': 'Marie Curie'}), 'headers': {'If-Match': if_match}}
+        response = self.update(event, {})
+        assert response['statusCode'] == 412
+        assert 'name' not in table.get_item(Key={'id': user['id']})['Item']
+
+    @mock_dynamodb
+    def test_update_if_match_any(self):
+        table = self.setup_table()
+        user = self.put_user(table)
+        event = {'body': json.dumps({'id': user['id'], 'name': 'Marie Curie'}), 'headers': {'If-Match': '*'}}
+        assert self.update(event, {})['statusCode'] == 200
+
+    @mock_dynamodb
+    def test_database_error_handling(self):
+        table = self.setup_table()
+        table.delete()
+        response = self.update({'body': json.dumps({'id': str(uuid.uuid4()), 'name': 'Marie Curie'})}, {})
+        assert response['statusCode'] == 500
+        assert json.loads(response['body'])['error'].startswith('Database error:')